@@ -334,17 +334,16 @@ if displayUI:
                     # get fares and taxis that need to be redrawn. We find these by checking the recording dicts
                     # for time points in advance of our current display timepoint. The nested comprehensions
                     # look formidable, but are simply extracting members with a time stamp ahead of our
-                    # most recent display time. The odd indexing fare[1].keys()[-1] gets the last element
-                    # in the time sequence dictionary for a fare (or taxi), which, because of the way this
-                    # is recorded, is guaranteed to be the most recent entry.
+                    # most recent display time. max(fare[1].keys()) gets the latest time stamp in the
+                    # time sequence dictionary for a fare (or taxi), which is its most recent entry.
                 faresToRedraw = dict([(fare[0], dict([(time[0], time[1])
                                                       for time in fare[1].items()
                                                       if time[0] > curTime]))
                                       for fare in values['fares'].items()
-                                      if sorted(list(fare[1].keys()))[-1] > curTime])
+                                      if max(fare[1].keys()) > curTime])
                 taxi0 = values['taxis'][100]
                 a = str(len(taxi0.items()))
-                b = str(sorted(list(taxi0.keys()))[-1])
+                b = str(max(taxi0.keys()))
                 c = str(curTime)
                 #print(c + ": " + a + " - " + b)
 
@@ -352,7 +351,7 @@ if displayUI:
                                                       for taxiPos in taxi[1].items()
                                                       if taxiPos[0] > curTime]))
                                       for taxi in values['taxis'].items()
-                                      if sorted(list(taxi[1].keys()))[-1] > curTime])
+                                      if max(taxi[1].keys()) > curTime])
                 ntdString = ""
                 noTaxisDrawn = len(taxisToRedraw) == 0
                 if noTaxisDrawn:
@@ -369,7 +368,7 @@ if displayUI:
                                                                len(taxiPalette)]
                         # but only plot taxis up to the palette limit (which can be easily extended)
                         if taxi[0] in taxiColours:
-                            newestTime = sorted(list(taxi[1].keys()))[-1]
+                            newestTime = max(taxi[1].keys())
                             # a taxi shows up as a circle in its colour
                             pygame.draw.circle(drawPositions[taxi[1][newestTime][0]][taxi[1][newestTime][1]],
                                                taxiColours[taxi[0]],
@@ -408,7 +407,7 @@ if displayUI:
                     # some fares still awaiting a taxi?
                 if len(faresToRedraw) > 0:
                     for fare in faresToRedraw.items():
-                        newestFareTime = sorted(list(fare[1].keys()))[-1]
+                        newestFareTime = max(fare[1].keys())
                         # fares are plotted as orange triangles (using pygame's points representation which
                         # is relative to the rectangular surface on which you are drawing)
                         pygame.draw.polygon(drawPositions[fare[0][0]][fare[0][1]],
@@ -4,12 +4,45 @@ import heapq
 
 from taxi import Taxi
 
+
+# the pricing rule of Dispatcher._costFare over an array of journey times: a flat fare if gridlocked
+def _priceKernel(timesToDestination):
+    return numpy.where(timesToDestination < 0, 150.0, (25.0+timesToDestination)/0.9)
+
+
+# the utility of Dispatcher._fareUtility1 over arrays of bids: payout per minute spent, or 0 if
+# either leg of the journey can't be made
+def _utilityKernel(payouts, fareJourneyTimes, travelToFareTimes):
+    utilities = numpy.zeros(payouts.shape[0])
+    valid = (fareJourneyTimes > -1) & (travelToFareTimes > -1)
+    utilities[valid] = payouts[valid] / \
+        (fareJourneyTimes[valid] + travelToFareTimes[valid])
+    return utilities
+
+
+# fare board coordinates are packed into a single int32 each, x in the high 16 bits and y in the low 16,
+# so the board's keys hash as plain ints and its coordinate columns are one array apiece
+def _pack(xy):
+    return (xy[0] << 16) | (xy[1] & 0xFFFF)
+
+
+def _unpack(key):
+    return (key >> 16, key & 0xFFFF)
+
+
+# _unpack over an array of packed coordinates, giving an (N, 2) array of (x, y)
+def _unpackArray(keys):
+    return numpy.column_stack((numpy.right_shift(keys, 16), numpy.bitwise_and(keys, 0xFFFF)))
+
 # a data container for all pertinent information related to fares. (Should we
 # add an underway flag and require taxis to acknowledge collection to the dispatcher?)
 
 
 class FareEntry:
 
+    # fixed fields, so no per-instance __dict__
+    __slots__ = ('origin', 'destination', 'calltime', 'price', 'taxi', 'bidders')
+
     def __init__(self, origin, dest, time, price=0, taxiIndex=-1):
 
         self.origin = origin
@@ -22,6 +55,161 @@ class FareEntry:
         self.bidders = []
 
 
+'''
+A FareTable is the Dispatcher's fare board laid out column-wise: rather than one FareEntry per fare, each
+field lives in its own numpy array and a fare is a row index into all of them. The per-tick checks the
+Dispatcher makes (is it priced? is it allocated? has anyone bid?) then become whole-array comparisons
+instead of a walk over every fare object. Origins and destinations are kept packed (see _pack), and rows
+are looked up by their (packed origin, packed destination, calltime) key. Removal swaps the last row into
+the hole, so row indices are only stable until the next remove.
+Fares are never removed once served, so the table also keeps the keys of the fares that still need action
+(awaiting a price, or priced and awaiting a taxi): each tick only has to look at those.
+'''
+
+
+class FareTable:
+
+    def __init__(self, capacity=64):
+
+        self.size = 0
+        self.origin = numpy.zeros(capacity, dtype=numpy.int32)
+        self.destination = numpy.zeros(capacity, dtype=numpy.int32)
+        self.callTime = numpy.zeros(capacity, dtype=numpy.int32)
+        # prices are kept in double precision so the dispatcher's figures agree with what the world pays out
+        self.price = numpy.zeros(capacity, dtype=numpy.float64)
+        # the taxi allocated to service the fare. -1 if none has been allocated
+        self.taxi = numpy.full(capacity, -1, dtype=numpy.int32)
+        self.bidderCount = numpy.zeros(capacity, dtype=numpy.int32)
+        # bidders are ragged, so they stay as a list of lists alongside the columns
+        self.bidders = []
+        # the (origin, destination, calltime) key of each row, and the reverse lookup
+        self.keys = []
+        self._rows = {}
+        # keys grouped by origin, in arrival order, so that bids (which only know the origin) can find their fare
+        self._byOrigin = {}
+        # keys of fares not yet priced, and of priced fares open for bidding (no taxi allocated yet).
+        # dicts rather than sets so that they keep arrival order
+        self._unpriced = {}
+        self._open = {}
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def _grow(self):
+        capacity = 2 * len(self.price)
+        for column in ('origin', 'destination', 'callTime', 'price', 'taxi', 'bidderCount'):
+            old = getattr(self, column)
+            new = numpy.full(capacity, -1 if column == 'taxi' else 0, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, column, new)
+
+    # add a fare, returning its row. An existing fare with the same key is reset, as it would be the same fare.
+    def add(self, origin, destination, time, price=0, taxiIndex=-1):
+        key = (origin, destination, time)
+        row = self._rows.get(key)
+        if row is None:
+            if self.size == len(self.price):
+                self._grow()
+            row = self.size
+            self.size += 1
+            self.bidders.append([])
+            self.keys.append(key)
+            self._rows[key] = row
+            self._byOrigin.setdefault(origin, {})[key] = None
+        self.origin[row] = origin
+        self.destination[row] = destination
+        self.callTime[row] = time
+        self.price[row] = price
+        self.taxi[row] = taxiIndex
+        self.bidderCount[row] = 0
+        self.bidders[row] = []
+        self._unpriced.pop(key, None)
+        self._open.pop(key, None)
+        if price == 0:
+            self._unpriced[key] = None
+        elif taxiIndex < 0:
+            self._open[key] = None
+        return row
+
+    # remove a fare by swapping the last row into its place
+    def remove(self, origin, destination, time):
+        key = (origin, destination, time)
+        row = self._rows.pop(key)
+        last = self.size - 1
+        if row != last:
+            for column in (self.origin, self.destination, self.callTime, self.price, self.taxi, self.bidderCount):
+                column[row] = column[last]
+            self.bidders[row] = self.bidders[last]
+            self.keys[row] = self.keys[last]
+            self._rows[self.keys[row]] = row
+        self.bidders.pop()
+        self.keys.pop()
+        self.size = last
+        self._unpriced.pop(key, None)
+        self._open.pop(key, None)
+        del self._byOrigin[origin][key]
+        if len(self._byOrigin[origin]) == 0:
+            del self._byOrigin[origin]
+
+    def rowOf(self, origin, destination, time):
+        return self._rows.get((origin, destination, time))
+
+    # the first fare at origin still awaiting allocation, or None
+    def openRow(self, origin):
+        for key in self._byOrigin.get(origin, ()):
+            row = self._rows[key]
+            if self.taxi[row] == -1:
+                return row
+        return None
+
+    def bid(self, row, taxiIndex):
+        self.bidders[row].append(taxiIndex)
+        self.bidderCount[row] += 1
+
+    # pricing a fare opens it for bidding
+    def setPrice(self, row, price):
+        key = self.keys[row]
+        self.price[row] = price
+        if key in self._unpriced:
+            del self._unpriced[key]
+            if self.taxi[row] < 0:
+                self._open[key] = None
+
+    # allocating a taxi closes the fare to further bidding
+    def allocate(self, row, taxiIndex):
+        self.taxi[row] = taxiIndex
+        self._open.pop(self.keys[row], None)
+
+    # the (origin, destination, calltime) of a row, with the coordinates unpacked
+    def fare(self, row):
+        origin, destination, time = self.keys[row]
+        return _unpack(origin), _unpack(destination), time
+
+    # a FareEntry copy of a row, for code that wants the fare as a single object
+    def entry(self, row):
+        origin, destination, time = self.fare(row)
+        fare = FareEntry(origin, destination, time, self.price[row], self.taxi[row])
+        fare.bidders = list(self.bidders[row])
+        return fare
+
+    # the rows of the given keys, oldest call first
+    def _inCallOrder(self, keys):
+        rows = numpy.fromiter((self._rows[key] for key in keys), dtype=numpy.intp, count=len(keys))
+        return rows[numpy.argsort(self.callTime[rows], kind='stable')]
+
+    # fares not yet priced (and so not yet broadcast)
+    def unpriced(self):
+        return self._inCallOrder(self._unpriced)
+
+    # priced fares with no taxi allocated that have at least one bid in
+    def biddable(self):
+        rows = self._inCallOrder(self._open)
+        return rows[self.bidderCount[rows] > 0]
+
+
 '''
 A Dispatcher is a static agent whose job is to allocate fares amongst available taxis. Like the taxis, all
 the relevant functionality happens in ClockTick. The Dispatcher has a list of taxis, a map of the service area,
@@ -34,6 +222,16 @@ now have the fare.
 
 class Dispatcher:
 
+    # clockTick_new's matching: an auction for the best total utility first (True), or greedy best-first only
+    # (False). Whatever the auction leaves unallocated goes to the greedy matching either way.
+    AUCTION = False
+    # the most bids an auction may take before falling back to the greedy matching
+    AUCTION_MAX_BIDS = 10000
+    # the auction's result is within 1/AUCTION_PRECISION of the utilities' spread of the best total, and
+    # its eps shrinks by AUCTION_SCALING per phase on the way there
+    AUCTION_PRECISION = 1000
+    AUCTION_SCALING = 5
+
     # constructor only needs to know the world it lives in, although you can also populate its knowledge base
     # with taxi and map information.
     def __init__(self, parent, taxis=None, serviceMap=None):
@@ -45,12 +243,28 @@ class Dispatcher:
         self._taxis = taxis
         if self._taxis is None:
             self._taxis = []
-        # fareBoard will be a nested dictionary indexed by origin, then destination, then call time.
-        # Its values are FareEntries. The nesting structure provides for reasonably fast lookup; it's
-        # more or less a multi-level hash.
-        self._fareBoard = {}
+        # reverse lookup of a taxi's index in the list, keyed by id() so that taxis needn't be hashable
+        self._taxiIndex = {}
+        for taxiIdx, taxi in enumerate(self._taxis):
+            self._taxiIndex.setdefault(id(taxi), taxiIdx)
+        # fareBoard is a FareTable: one row per fare, indexed by origin, destination and call time.
+        self._fareBoard = FareTable()
         # serviceMap gives the dispatcher its service area
         self._map = serviceMap
+        # world nodes already looked up, indexed by (x,y). Nodes are fixed objects (their traffic is read
+        # live), so this only needs clearing when the map changes
+        self._nodeCache = {}
+        # map distances from every node to a given fare origin, indexed by origin, and the reversed map
+        # the searches for them run over. Again these only change with the map
+        self._timesToNode = {}
+        self._reverseMap = None
+        # which taxis (by index) are on duty with nowhere to go, and how many. Taxis report changes through
+        # taxiFree, so the optimiser tick can count them without looking at every taxi.
+        # Bids from busy taxis are still matched: they queue the fare up for when the taxi is done
+        self._freeTaxis = numpy.zeros(len(self._taxis), dtype=bool)
+        for taxiIdx in self._taxiIndex.values():
+            self._freeTaxis[taxiIdx] = self._taxis[taxiIdx].onDuty and len(self._taxis[taxiIdx]._path) == 0
+        self._freeCount = int(numpy.count_nonzero(self._freeTaxis))
         self._calls = 0
 
     # _________________________________________________________________________________________________________
@@ -58,8 +272,12 @@ class Dispatcher:
 
     # make a new taxi known.
     def addTaxi(self, taxi):
-        if taxi not in self._taxis:
+        if id(taxi) not in self._taxiIndex:
+            self._taxiIndex[id(taxi)] = len(self._taxis)
             self._taxis.append(taxi)
+            free = taxi.onDuty and len(taxi._path) == 0
+            self._freeTaxis = numpy.append(self._freeTaxis, free)
+            self._freeCount += int(free)
 
     # incrementally add to the map. This can be useful if, e.g. the world itself has a set of
     # nodes incrementally added. It can then call this function on the dispatcher to add to
@@ -67,6 +285,7 @@ class Dispatcher:
     def addMapNode(self, coords, neighbours):
         if self._parent is None:
             return AttributeError("This Dispatcher does not exist in any world")
+        self._mapChanged()
         node = self._parent.getNode(coords[0], coords[1])
         if node is None:
             return KeyError("No such node: {0} in this Dispatcher's service area".format(coords))
@@ -81,12 +300,25 @@ class Dispatcher:
                 neighbour[0], self._parent.distance2Node(node, neighbourNode))
         self._map[coords] = neighbourDict
 
+    # drop everything worked out from the map
+    def _mapChanged(self):
+        self._nodeCache = {}
+        self._timesToNode = {}
+        self._reverseMap = None
+
+    # the world's node at coords, by way of the node cache
+    def _node(self, coords):
+        if coords not in self._nodeCache:
+            self._nodeCache[coords] = self._parent.getNode(coords[0], coords[1])
+        return self._nodeCache[coords]
+
     # importMap gets the service area map, and can be brought in incrementally as well as
     # in one wodge.
     def importMap(self, newMap):
         # a fresh map can just be inserted
         if self._map is None:
             self._map = newMap
+            self._mapChanged()
         # but importing a new map where one exists implies adding to the
         # existing one. (Check that this puts in the right values!)
         else:
@@ -101,13 +333,10 @@ class Dispatcher:
         if self._parent == parent:
             # handover implies taxis definitely known to a previous dispatcher. The current
             # dispatcher should thus be made aware of them
-            if taxi not in self._taxis:
-                self._taxis.append(taxi)
+            self.addTaxi(taxi)
             # add any fares found along with their allocations
-            self.newFare(parent, origin, destination, time)
-            self._fareBoard[origin][destination][time].taxi = self._taxis.index(
-                taxi)
-            self._fareBoard[origin][destination][time].price = price
+            self._fareBoard.add(_pack(origin), _pack(destination), time,
+                                price, self._taxiIndex[id(taxi)])
 
     # --------------------------------------------------------------------------------------------------------------
     # runtime methods used to inform the Dispatcher of real-time events
@@ -117,62 +346,42 @@ class Dispatcher:
     def newFare(self, parent, origin, destination, time):
         # only add new fares coming from the same world
         if parent == self._parent:
-            fare = FareEntry(origin, destination, time)
-            if origin in self._fareBoard:
-                if destination not in self._fareBoard[origin]:
-                    self._fareBoard[origin][destination] = {}
-            else:
-                self._fareBoard[origin] = {destination: {}}
             # overwrites any existing fare with the same (origin, destination, calltime) triplet, but
             # this would be equivalent to saying it was the same fare, at least in this world where
             # a given Node only has one fare at a time.
-            self._fareBoard[origin][destination][time] = fare
+            self._fareBoard.add(_pack(origin), _pack(destination), time)
 
     # abandoning fares will call this to cancel their request
     def cancelFare(self, parent, origin, destination, calltime):
         # if the fare exists in our world,
-        # fareboard = {origin1:
-        #                 {destination1:
-        #                      [calltime1, calltime2]]
-        #                 ,
-        #                  destination2:
-        #                       [calltime1]
-        #                 },
-        #              origin2:
-        #                 {destination1:
-        #                      [calltime1, calltime2]]
-        #                 }
-        #              }
-        if parent == self._parent and origin in self._fareBoard:
-            if destination in self._fareBoard[origin]:
-                if calltime in self._fareBoard[origin][destination]:
-                    # get rid of it
-                    # print("Fare ({0},{1}) cancelled".format(
-                    #     origin[0], origin[1]))
-                    # inform taxis that the fare abandoned
-                    self._parent.cancelFare(
-                        origin, self._taxis[self._fareBoard[origin][destination][calltime].taxi])
-                    del self._fareBoard[origin][destination][calltime]
-                if len(self._fareBoard[origin][destination]) == 0:
-                    del self._fareBoard[origin][destination]
-                if len(self._fareBoard[origin]) == 0:
-                    del self._fareBoard[origin]
+        if parent == self._parent:
+            row = self._fareBoard.rowOf(_pack(origin), _pack(destination), calltime)
+            if row is not None:
+                # get rid of it
+                # print("Fare ({0},{1}) cancelled".format(
+                #     origin[0], origin[1]))
+                # inform taxis that the fare abandoned
+                self._parent.cancelFare(
+                    origin, self._taxis[self._fareBoard.taxi[row]])
+                self._fareBoard.remove(_pack(origin), _pack(destination), calltime)
 
     # taxis register their bids for a fare using this mechanism
     def fareBid(self, origin, taxi):
         # rogue taxis (not known to the dispatcher) can't bid on fares
-        if taxi in self._taxis:
-            # everyone else bids on fares available
-            if origin in self._fareBoard:
-                for destination in self._fareBoard[origin].keys():
-                    for time in self._fareBoard[origin][destination].keys():
-                        # as long as they haven't already been allocated
-                        if self._fareBoard[origin][destination][time].taxi == -1:
-                            self._fareBoard[origin][destination][time].bidders.append(
-                                self._taxis.index(taxi))
-                            # only one fare per origin can be actively open for bid, so
-                            # immediately return once we[ve found it
-                            return
+        if id(taxi) in self._taxiIndex:
+            # everyone else bids on fares available, as long as they haven't already been allocated.
+            # only one fare per origin can be actively open for bid, so the first one found is it
+            row = self._fareBoard.openRow(_pack(origin))
+            if row is not None:
+                self._fareBoard.bid(row, self._taxiIndex[id(taxi)])
+
+    # taxis call this (through the parent world) when they become free for a fare, or stop being free
+    def taxiFree(self, parent, taxi, free):
+        if self._parent == parent:
+            taxiIdx = self._taxiIndex.get(id(taxi))
+            if taxiIdx is not None and self._freeTaxis[taxiIdx] != free:
+                self._freeTaxis[taxiIdx] = free
+                self._freeCount += 1 if free else -1
 
     # fares call this (through the parent world) when they have reached their destination
     def recvPayment(self, parent, amount):
@@ -186,88 +395,198 @@ class Dispatcher:
     # allocateFare(origin, taxi).
     def clockTick_new(self, parent):
         # This version is the Optimiser ClockTick
-        taxiCount = sum([taxi.onDuty and len(taxi._path) == 0
-                        for taxi in self._taxis])
-        fareMatchings = []
-        fareCount = 0
+        taxiCount = self._freeCount
+        # path-planning results for this tick only: taxis move between ticks, so these can't be kept.
+        # fareLegTimes is indexed by (origin, destination), taxiLegTimes by (taxi number, origin)
+        fareLegTimes = {}
+        taxiLegTimes = {}
         if self._parent == parent:
-            for origin in self._fareBoard.keys():
-                for destination in self._fareBoard[origin].keys():
-                    for time in sorted(list(self._fareBoard[origin][destination].keys())):
-                        if self._fareBoard[origin][destination][time].price == 0:
-                            self._fareBoard[origin][destination][time].price = self._costFare(
-                                self._fareBoard[origin][destination][time])
-                            # broadcastFare actually returns the number of taxis that got the info, if you
-                            # wish to use that information in the decision over when to allocate
-                            self._parent.broadcastFare(origin,
-                                                       destination,
-                                                       self._fareBoard[origin][destination][time].price)
-                        elif taxiCount > 0 and self._fareBoard[origin][destination][time].taxi < 0 and len(self._fareBoard[origin][destination][time].bidders) > 0:
-                            newMatchings = self._allocateFare_Ret(
-                                origin, destination, time)
-                            # this is bad - heapq does NOT have a maxHeap implementation!
-                            # we have to negate our utility instead.
-                            # https://stackoverflow.com/questions/2501457/what-do-i-use-for-a-max-heap-implementation-in-python
-                            [heapq.heappush(fareMatchings, (-a[0], a[1], a[2], a[3]))
-                             for a in newMatchings]
-                            fareCount += 1
+            # new fares are priced and broadcast whether or not any taxi is free to take them
+            unpriced = self._fareBoard.unpriced()
+            for row, price in zip(unpriced, self._costFares(unpriced)):
+                self._broadcastRow(row, price)
 
+            # but with no free taxis there is nothing to allocate, so no path planning is needed
             if taxiCount == 0:
                 return
 
+            # fares priced just now can't have collected any bids yet, so won't be selected here
+            biddable = self._fareBoard.biddable()
+            fareCount = len(biddable)
+            fareMatchings = self._allocateFare_Ret(
+                biddable, fareLegTimes=fareLegTimes, taxiLegTimes=taxiLegTimes)
+            # the board row of each fare being matched, so a fare that gets its taxi is closed to later ticks.
+            # biddable is oldest call first, so a repeated (origin, destination) closes the oldest
+            fareRows = {}
+            for row in biddable.tolist():
+                origin, destination, time = self._fareBoard.fare(row)
+                fareRows.setdefault((origin, destination), row)
+
             # Now we have an array of fareMatchings.
             # Perform an optimising CSP:
             # Match the taxis and fares up to maximise Utility.
             # Is this a good time to talk about Nash Equilibrium?
             # Two taxis might want to go for sub-optimal matchings for greater total revenue... maybe
-            # My algorithm is not that smart
+            # so the matching can start with an auction, which is near-optimal for total utility.
             # fareMatchings = [(utility, origin, destination, taxiIdx), ... ]
-            # sort by utility
-
-            # algo 1: get the largest
-            taxisToAllocate = True
-            allocatedTaxis = []
-            allocatedFares = []
-            while taxisToAllocate and len(fareMatchings) > 0:
-                # print("time {0} - fare utilities: {1}".format(self._parent._time,
-                #      str([a[0] for a in fareMatchings])))
-                utility, origin, destination, taxiIdx = heapq.heappop(
-                    fareMatchings)
-                utility = -utility
-                if utility < 1 and False:
-                    # enabling this section will only allow >1 utilities!
-                    pass
-                elif taxiIdx not in allocatedTaxis and (origin, destination) not in allocatedFares:
-                    allocated = self._parent.allocateFare(
-                        origin, self._taxis[taxiIdx])
-                    if not allocated:
-                        # networld disallowed this fare. keep trying
-                        pass
-                    else:
-                        allocatedTaxis.append(taxiIdx)
-                        allocatedFares.append((origin, destination))
-                if len(allocatedTaxis) == taxiCount or len(allocatedTaxis) == fareCount:
-                    taxisToAllocate = False
+            allocatedTaxis = set()
+            allocatedFares = set()
+            assignments = None
+            if self.AUCTION:
+                assignments = self._auction(fareMatchings)
+            if assignments is not None:
+                for utility, origin, destination, taxiIdx in sorted(assignments, reverse=True):
+                    if len(allocatedTaxis) == taxiCount:
+                        break
+                    if self._parent.allocateFare(origin, self._taxis[taxiIdx]):
+                        self._fareBoard.allocate(fareRows[(origin, destination)], taxiIdx)
+                        allocatedTaxis.add(taxiIdx)
+                        allocatedFares.add((origin, destination))
+            # the greedy matching then does the rest: all of it when there was no auction, otherwise
+            # whichever taxis the world turned down for their auctioned fare
+            self._allocateGreedily(fareMatchings, taxiCount, fareCount,
+                                   allocatedTaxis, allocatedFares, fareRows)
+
+    # the greedy matching: repeatedly take the best remaining (utility, origin, destination, taxiIdx) matching
+    # whose taxi and fare are both still unallocated. The best is an argmax over the utility matrix, and
+    # allocating a taxi to a fare rules out the rest of that taxi's column and that fare's row. Given the board
+    # rows of the fares (fareRows, indexed by (origin, destination)), allocated fares are closed on the board
+    def _allocateGreedily(self, fareMatchings, taxiCount, fareCount, allocatedTaxis=None, allocatedFares=None,
+                          fareRows=None):
+        if allocatedTaxis is None:
+            allocatedTaxis = set()
+        if allocatedFares is None:
+            allocatedFares = set()
+        taxisToAllocate = len(allocatedTaxis) < taxiCount and len(
+            allocatedTaxis) < fareCount
+        if not taxisToAllocate or len(fareMatchings) == 0:
+            return
+        utilities, fareKeys, taxiIdxs = self._utilityMatrix(fareMatchings)
+        # anything the auction has already placed is out of the running
+        for fare, fareKey in enumerate(fareKeys):
+            if fareKey in allocatedFares:
+                utilities[fare, :] = -numpy.inf
+        for taxi, taxiIdx in enumerate(taxiIdxs):
+            if taxiIdx in allocatedTaxis:
+                utilities[:, taxi] = -numpy.inf
+
+        # algo 1: get the largest
+        while taxisToAllocate:
+            fare, taxi = divmod(int(numpy.argmax(utilities)), utilities.shape[1])
+            # a utility of 0 means the taxi can't make one of the legs, so that is as good as no bid
+            if not utilities[fare, taxi] > 0:
+                break
+            origin, destination = fareKeys[fare]
+            taxiIdx = taxiIdxs[taxi]
+            allocated = self._parent.allocateFare(
+                origin, self._taxis[taxiIdx])
+            if not allocated:
+                # networld disallowed this fare. keep trying
+                utilities[fare, taxi] = -numpy.inf
+            else:
+                if fareRows is not None:
+                    self._fareBoard.allocate(fareRows[(origin, destination)], taxiIdx)
+                allocatedTaxis.add(taxiIdx)
+                allocatedFares.add((origin, destination))
+                utilities[fare, :] = -numpy.inf
+                utilities[:, taxi] = -numpy.inf
+            if len(allocatedTaxis) == taxiCount or len(allocatedTaxis) == fareCount:
+                taxisToAllocate = False
+
+    # fareMatchings laid out as a matrix of utilities[fare, taxi], -inf where the taxi made no bid, along with
+    # the (origin, destination) of each fare row and the taxi index of each column. Both are in ascending
+    # order, so the first maximum in the matrix is the one that sorts first, fare and then taxi.
+    def _utilityMatrix(self, fareMatchings):
+        fareKeys = sorted({(origin, destination) for utility, origin, destination, taxiIdx in fareMatchings})
+        taxiIdxs = sorted({taxiIdx for utility, origin, destination, taxiIdx in fareMatchings})
+        fareIds = {fareKey: fare for fare, fareKey in enumerate(fareKeys)}
+        taxiIds = {taxiIdx: taxi for taxi, taxiIdx in enumerate(taxiIdxs)}
+        fares = numpy.fromiter((fareIds[(origin, destination)] for utility, origin, destination, taxiIdx in fareMatchings),
+                               dtype=numpy.intp, count=len(fareMatchings))
+        taxis = numpy.fromiter((taxiIds[taxiIdx] for utility, origin, destination, taxiIdx in fareMatchings),
+                               dtype=numpy.intp, count=len(fareMatchings))
+        utilities = numpy.full((len(fareKeys), len(taxiIdxs)), -numpy.inf)
+        # a taxi can bid on two fares with the same origin and destination: keep the better
+        numpy.maximum.at(utilities, (fares, taxis), [matching[0] for matching in fareMatchings])
+        return utilities, fareKeys, taxiIdxs
+
+    # Bertsekas' auction algorithm for the assignment of taxis to fares. Each unassigned bidder takes the option
+    # worth most to it at current prices, raising that option's price by its margin over the next best (plus
+    # eps) and displacing any previous holder. Staying free is worth 0 to a taxi, and leaving a fare unserved
+    # costs nothing, so the problem is squared up with a stay-free column per taxi and a dummy bidder per fare
+    # that values everything at 0; every bidder then ends up with something. The utilities are not integers,
+    # so eps is scaled to their spread and shrunk phase by phase (keeping the prices), ending within
+    # 1/AUCTION_PRECISION of the spread of the best total utility. Returns the assigned matchings, or None if
+    # no taxi has a choice of fares (the greedy matching is then already optimal) or the auction runs out of bids.
+    def _auction(self, fareMatchings):
+        if len(fareMatchings) == len({taxiIdx for utility, origin, destination, taxiIdx in fareMatchings}):
+            return None
+        fareUtilities, fareKeys, taxiIdxs = self._utilityMatrix(fareMatchings)
+        # as in the greedy matching, a utility of 0 means the taxi can't make one of the legs: no bid
+        fareUtilities[fareUtilities <= 0] = -numpy.inf
+        bidUtilities = fareUtilities[fareUtilities > -numpy.inf]
+        if len(bidUtilities) == 0 or not numpy.isfinite(bidUtilities).all():
+            return None
+        fareCount = len(fareKeys)
+        taxiCount = len(taxiIdxs)
+        size = taxiCount + fareCount
+        # rows are the taxis then the dummy bidders, columns the fares then the stay-free options
+        utilities = numpy.full((size, size), -numpy.inf)
+        utilities[:taxiCount, :fareCount] = fareUtilities.T
+        utilities[:taxiCount, fareCount:] = 0.0
+        utilities[taxiCount:, :] = 0.0
+        spread = max(bidUtilities.max(), 0.0) - min(bidUtilities.min(), 0.0)
+        if spread == 0:
+            spread = 1.0
+        # n*eps bounds the shortfall from the best total, so the last phase's eps is spread/(AUCTION_PRECISION*n)
+        finalEps = spread / (self.AUCTION_PRECISION * (size + 1))
+        eps = spread / (self.AUCTION_SCALING * (size + 1))
+        prices = numpy.zeros(size)
+        bids = 0
+        while True:
+            owners = numpy.full(size, -1)
+            unassigned = list(range(size))
+            while len(unassigned) > 0:
+                if bids == self.AUCTION_MAX_BIDS:
+                    return None
+                bidder = unassigned.pop()
+                values = utilities[bidder] - prices
+                option = int(numpy.argmax(values))
+                best = values[option]
+                values[option] = -numpy.inf
+                prices[option] += best - values.max() + eps
+                if owners[option] >= 0:
+                    unassigned.append(owners[option])
+                owners[option] = bidder
+                bids += 1
+            if eps <= finalEps:
+                break
+            eps = max(eps / self.AUCTION_SCALING, finalEps)
+        return [(fareUtilities[fare, owners[fare]], fareKeys[fare][0], fareKeys[fare][1], taxiIdxs[owners[fare]])
+                for fare in range(fareCount) if owners[fare] < taxiCount]
 
     def clockTick(self, parent):
         if self._parent == parent:
-            for origin in self._fareBoard.keys():
-                for destination in self._fareBoard[origin].keys():
-                    # TODO - if you can come up with something better. Not essential though.
-                    # not super-efficient here: need times in order, dictionary view objects are not
-                    # sortable because they are an iterator, so we need to turn the times into a
-                    # sorted list. Hopefully fareBoard will never be too big
-                    for time in sorted(list(self._fareBoard[origin][destination].keys())):
-                        if self._fareBoard[origin][destination][time].price == 0:
-                            self._fareBoard[origin][destination][time].price = self._costFare(
-                                self._fareBoard[origin][destination][time])
-                            # broadcastFare actually returns the number of taxis that got the info, if you
-                            # wish to use that information in the decision over when to allocate
-                            self._parent.broadcastFare(origin,
-                                                       destination,
-                                                       self._fareBoard[origin][destination][time].price)
-                        elif self._fareBoard[origin][destination][time].taxi < 0 and len(self._fareBoard[origin][destination][time].bidders) > 0:
-                            self._allocateFare(origin, destination, time)
+            # fares needing a price, and fares ready to allocate, each in call-time order
+            unpriced = self._fareBoard.unpriced()
+            biddable = self._fareBoard.biddable()
+            for row, price in zip(unpriced, self._costFares(unpriced)):
+                self._broadcastRow(row, price)
+            # path-planning results shared between fares for this tick only
+            fareLegTimes = {}
+            taxiLegTimes = {}
+            for row in biddable:
+                origin, destination, time = self._fareBoard.fare(row)
+                self._allocateFare(origin, destination, time,
+                                   fareLegTimes=fareLegTimes, taxiLegTimes=taxiLegTimes)
+
+    # price a fare on the board and announce it to the taxis
+    def _broadcastRow(self, row, price):
+        origin, destination, time = self._fareBoard.fare(row)
+        self._fareBoard.setPrice(row, price)
+        # broadcastFare actually returns the number of taxis that got the info, if you
+        # wish to use that information in the decision over when to allocate
+        self._parent.broadcastFare(origin, destination, price)
 
     # ----------------------------------------------------------------------------------------------------------------
 
@@ -288,171 +607,167 @@ class Dispatcher:
     # It will give the dispatcher a lot of money
     # But for real investiate minimaxing - maybe?
 
-    def _costFare_advanced(self, fare):
-        # cost fares with our traffic includer.
-        fareJourneyTime = -1
-        args = {'travelTime': []}
-        fareJourneyPath = self._taxis[0]._planPath(
-            fare.origin, fare.destination, **args)
-        fareJourneyTime = args['travelTime'][0]
-        # if the world is gridlocked, a flat fare applies.
-        if fareJourneyTime < 0:
-            returnVal = 150
-        returnVal = (25+fareJourneyTime)/0.9
-        return returnVal
-
     def _costFare(self, fare):
-        timeToDestination = self._parent.travelTime(self._parent.getNode(fare.origin[0], fare.origin[1]),
-                                                    self._parent.getNode(fare.destination[0], fare.destination[1]))
+        timeToDestination = self._parent.travelTime(self._node(fare.origin),
+                                                    self._node(fare.destination))
         # if the world is gridlocked, a flat fare applies.
         if timeToDestination < 0:
             return 150
         return (25+timeToDestination)/0.9
 
+    # _costFare for a batch of fare board rows. The world's travelTimes gives every journey time in one
+    # call, and the prices are worked out together; worlds without it are costed a fare at a time.
+    def _costFares(self, rows):
+        if len(rows) == 0:
+            return []
+        if not hasattr(self._parent, 'travelTimes'):
+            return [self._costFare(self._fareBoard.entry(row)) for row in rows]
+        origins = _unpackArray(self._fareBoard.origin[rows])
+        destinations = _unpackArray(self._fareBoard.destination[rows])
+        timesToDestination = self._parent.travelTimes(origins, destinations)
+        return _priceKernel(timesToDestination).tolist()
+
     # TODO
     # this method decides which taxi to allocate to a given fare. The algorithm here is not a fair allocation
     # scheme: taxis can (and do!) get starved for fares, simply because they happen to be far away from the
     # action. You should be able to do better than that using some form of CSP solver (this is just a suggestion,
     # other methods are also acceptable and welcome).
-    def _allocateFare(self, origin, destination, time):
+    def _allocateFare(self, origin, destination, time, **caches):
         self._calls += 1
-        if False:
-            self._allocateFare_Original(origin, destination, time)
-        if True:
-            self._allocateFareWithUtility(
-                origin, destination, time, self._fareUtility1)
-        if False:
-            self._allocateFareWithUtility(
-                origin, destination, time, self._fareUtility2)
-        if False:
-            pass
-
-    def _allocateFare_Ret(self, origin, destination, time):
-        self._calls += 1
-        returnVal = []
-        if True:
-            returnVal = self._allocateFareWithUtility_Ret(
-                origin, destination, time, self._fareUtility1)
-        if False:
-            pass
-        return returnVal
-
-    def _fareUtility1(self, taxi, origin, destination, time):
+        self._allocateFareWithUtility(
+            origin, destination, time, self._fareUtility1, **caches)
+
+    # _allocateFare_Ret scores every bid on the fares in rows, returning (utility, origin, destination, taxiIdx)
+    # matchings for all of them together
+    def _allocateFare_Ret(self, rows, **caches):
+        self._calls += len(rows)
+        return self._allocateFaresWithUtility1_Ret(rows, **caches)
+
+    # travel time from origin to destination using taxi's routefinder. 0 if already there, -1 if unreachable
+    def _legTime(self, taxi, origin, destination):
+        path, travelTime = taxi._planPath(origin, destination)
+        return travelTime
+
+    # _legTime, but looked up in (and saved to) cache under key when a cache is given
+    def _cachedLegTime(self, cache, key, taxi, origin, destination):
+        if cache is None:
+            return self._legTime(taxi, origin, destination)
+        if key not in cache:
+            cache[key] = self._legTime(taxi, origin, destination)
+        return cache[key]
+
+    # map distance from every node that can reach target, as a dict indexed by node. This is one Dijkstra
+    # search backwards along the streets from target, and is kept until the map changes
+    def _timesTo(self, target):
+        if target not in self._timesToNode:
+            if self._reverseMap is None:
+                self._reverseMap = {}
+                for node, neighbours in self._map.items():
+                    for neighbour, (direction, distance) in neighbours.items():
+                        self._reverseMap.setdefault(
+                            neighbour, []).append((node, distance))
+            times = {}
+            frontier = [(0, target)]
+            while len(frontier) > 0:
+                time, node = heapq.heappop(frontier)
+                if node not in times:
+                    times[node] = time
+                    for previous, distance in self._reverseMap.get(node, []):
+                        if previous not in times:
+                            heapq.heappush(frontier, (time+distance, previous))
+            self._timesToNode[target] = times
+        return self._timesToNode[target]
+
+    # how long taxi will take to reach a fare at origin: -1 if it can't. With a map this is a lookup in
+    # the distances to origin plus the traffic waiting at origin right now, which is what the taxi's
+    # traffic-aware routefinder would make it (infinite if origin is gridlocked). Otherwise the taxi
+    # plans the path (cached in taxiLegTimes, if given)
+    def _travelToFareTime(self, taxi, origin, taxiLegTimes=None):
+        if self._map is not None:
+            location = taxi.currentLocation
+            if location == origin:
+                return 0
+            mapTime = self._timesTo(origin).get(location, -1)
+            if mapTime < 0:
+                return -1
+            originNode = self._node(origin)
+            if originNode.traffic == originNode.maxTraffic:
+                return math.inf
+            return mapTime + originNode.traffic
+        return self._cachedLegTime(taxiLegTimes, (taxi.number, origin), taxi, taxi.currentLocation, origin)
+
+    # utilities are called once per bidder with the fare's journey time and payout, which are the same
+    # for every bidder and so are worked out beforehand, and the bidder's own time to reach the fare
+    def _fareUtility1(self, taxi, origin, fareJourneyTime, farePayout, travelToFareTime):
         # return farePayout / (how long will it take to get the payout)
-        # make use of the taxi's routefinder. It is a private method, but it's very useful.
         # fareJourneyTime = the actual fare's itineary time
         # travelToFareTime = how long it will take to reach the fare
-        fareJourneyTime = -1
-        travelToFareTime = -1
-        args = {'travelTime': []}
-        fareJourneyPath = taxi._planPath(
-            origin, destination, **args)
-        fareJourneyTime = args['travelTime'][0]
-        fareTravelPath = taxi._planPath(
-            taxi.currentLocation, origin, **args)
-        travelToFareTime = args['travelTime'][0]
-        farePayout = self._fareBoard[origin][destination][time].price
         returnVal = 0
         if fareJourneyTime > -1 and travelToFareTime > -1:
             returnVal = farePayout / \
                 (fareJourneyTime + travelToFareTime)
         return returnVal
 
-    def _fareUtility2(self, taxi, origin, destination, time):
-        # a "best improvement" algorithm
-        # return the increase in a taxi's account, as a ratio
-        # allocateFareWithUtility will choose the taxi with the best % improvement
-        fareJourneyTime = -1
-        travelToFareTime = -1
-        args = {'travelTime': []}
-        fareJourneyPath = taxi._planPath(
-            origin, destination, **args)
-        fareJourneyTime = args['travelTime'][0]
-        fareTravelPath = taxi._planPath(
-            taxi.currentLocation, origin, **args)
-        travelToFareTime = args['travelTime'][0]
-
-        returnVal = -math.inf
-        if fareJourneyTime > -1 and travelToFareTime > -1:
-            farePayout = self._fareBoard[origin][destination][time].price
-            accountBeforeFare = taxi._account
-            accountAfterFare = accountBeforeFare + farePayout - \
-                (fareJourneyTime + travelToFareTime)
-            if accountBeforeFare < 1:
-                # stop worrying about improvement once you're bankrupt.
-                # also avoid div/0 problems :)
-                accountBeforeFare = 1
-            # if accountAfterFare < 1:
-            #    returnVal = - 100 + farePayout
-            else:
-                returnVal = accountAfterFare / accountBeforeFare
-        return returnVal
+    # the fare's journey time is the same for every bidder, so plan it once with the first of them
+    def _fareJourneyTime(self, origin, destination, bidders, fareLegTimes=None):
+        for taxiIdx in bidders:
+            if len(self._taxis) > taxiIdx:
+                return self._cachedLegTime(fareLegTimes, (origin, destination),
+                                           self._taxis[taxiIdx], origin, destination)
+        return -1
 
-    def _allocateFareWithUtility(self, origin, destination, time, utilityMethod):
+    def _allocateFareWithUtility(self, origin, destination, time, utilityMethod, fareLegTimes=None, taxiLegTimes=None):
         allocatedTaxi = -1
-        utilities = {}
+        bestUtility = -math.inf
         utility = 0
-        fareNode = self._parent.getNode(origin[0], origin[1])
+        row = self._fareBoard.rowOf(_pack(origin), _pack(destination), time)
+        fareNode = self._node(origin)
         if fareNode is not None:
-            for taxiIdx in self._fareBoard[origin][destination][time].bidders:
+            bidders = self._fareBoard.bidders[row]
+            fareJourneyTime = self._fareJourneyTime(
+                origin, destination, bidders, fareLegTimes)
+            farePayout = self._fareBoard.price[row]
+            for taxiIdx in bidders:
                 if len(self._taxis) > taxiIdx:
-                    utility = utilityMethod(
-                        self._taxis[taxiIdx], origin, destination, time)
+                    taxi = self._taxis[taxiIdx]
+                    utility = utilityMethod(taxi, origin, fareJourneyTime, farePayout,
+                                            self._travelToFareTime(taxi, origin, taxiLegTimes))
                     # new addition: Only accept a fare if it is >1 utility
                     # if utility > 1:
-                    utilities[utility] = taxiIdx
-                    # If two taxis have identical utility - keep the most recent
+                    # If two taxis have identical utility - keep the first bidder
+                    if allocatedTaxi < 0 or utility > bestUtility:
+                        bestUtility = utility
+                        allocatedTaxi = taxiIdx
 
-            if len(utilities) > 0:
-                bestUtility = max(utilities.keys())
-                allocatedTaxi = utilities[bestUtility]
-                self._fareBoard[origin][destination][time].taxi = allocatedTaxi
+            if allocatedTaxi >= 0:
+                self._fareBoard.allocate(row, allocatedTaxi)
                 self._parent.allocateFare(
                     origin, self._taxis[allocatedTaxi])
 
-    def _allocateFareWithUtility_Ret(self, origin, destination, time, utilityMethod):
-        taxiFareMatchings = []
-        utility = 0
-        fareNode = self._parent.getNode(origin[0], origin[1])
-        if fareNode is not None:
-            for taxiIdx in self._fareBoard[origin][destination][time].bidders:
-                if len(self._taxis) > taxiIdx:
-                    utility = utilityMethod(
-                        self._taxis[taxiIdx], origin, destination, time)
-                    taxiFareMatchings.append(
-                        (utility, origin, destination, taxiIdx))
-
-        return taxiFareMatchings
-
-    def _allocateFare_Original(self, origin, destination, time):
-        # a very simple approach here gives taxis at most 5 ticks to respond, which can
-        # surely be improved upon.
-        if self._parent.simTime-time > 5:
-            allocatedTaxi = -1
-            winnerNode = None
-            fareNode = self._parent.getNode(origin[0], origin[1])
-            # this does the allocation. There are a LOT of conditions to check, namely:
-            # 1) that the fare is asking for transport from a valid location;
-            # 2) that the bidding taxi is in the dispatcher's list of taxis
-            # 3) that the taxi's location is 'on-grid': somewhere in the dispatcher's map
-            # 4) that at least one valid taxi has actually bid on the fare -- REMOVED SM 2021-12-05
-            if fareNode is not None:
-                for taxiIdx in self._fareBoard[origin][destination][time].bidders:
+    # scores every bid on many fares with _fareUtility1: the legs of every bid are planned
+    # first, then all the utilities come out of one call to _utilityKernel
+    def _allocateFaresWithUtility1_Ret(self, rows, fareLegTimes=None, taxiLegTimes=None):
+        matchings = []
+        payouts = []
+        fareJourneyTimes = []
+        travelToFareTimes = []
+        for row in rows:
+            origin, destination, time = self._fareBoard.fare(row)
+            if self._node(origin) is not None:
+                bidders = self._fareBoard.bidders[row]
+                farePayout = self._fareBoard.price[row]
+                fareJourneyTime = self._fareJourneyTime(
+                    origin, destination, bidders, fareLegTimes)
+                for taxiIdx in bidders:
                     if len(self._taxis) > taxiIdx:
-                        bidderLoc = self._taxis[taxiIdx].currentLocation
-                        bidderNode = self._parent.getNode(
-                            bidderLoc[0], bidderLoc[1])
-                        if bidderNode is not None:
-                            # ultimately the naive algorithm chosen is which taxi is the closest. This is patently unfair for several
-                            # reasons, but does produce *a* winner.
-                            if winnerNode is None or self._parent.distance2Node(bidderNode, fareNode) < self._parent.distance2Node(winnerNode, fareNode):
-                                allocatedTaxi = taxiIdx
-                                winnerNode = bidderNode
-                # BUG FIX SM 2021-12-05: un-indented this section so single-taxi worlds work.
-                # and after all that, we still have to check that somebody won, because any of the other reasons to invalidate
-                # the auction may have occurred.
-                if allocatedTaxi >= 0:
-                    # but if so, allocate the taxi.
-                    self._fareBoard[origin][destination][time].taxi = allocatedTaxi
-                    self._parent.allocateFare(
-                        origin, self._taxis[allocatedTaxi])
+                        taxi = self._taxis[taxiIdx]
+                        matchings.append((origin, destination, taxiIdx))
+                        payouts.append(farePayout)
+                        fareJourneyTimes.append(fareJourneyTime)
+                        travelToFareTimes.append(
+                            self._travelToFareTime(taxi, origin, taxiLegTimes))
+        utilities = _utilityKernel(numpy.array(payouts, dtype=numpy.float64),
+                                   numpy.array(fareJourneyTimes, dtype=numpy.float64),
+                                   numpy.array(travelToFareTimes, dtype=numpy.float64))
+        return [(utility, origin, destination, taxiIdx)
+                for utility, (origin, destination, taxiIdx) in zip(utilities.tolist(), matchings)]
@@ -0,0 +1,93 @@
+import math
+
+from dispatcher import _pack
+
+# strategies the Dispatcher used to run behind "if False:" switches. None of them is called any more,
+# but they are kept here to compare against. Each takes the dispatcher as its first argument, e.g.
+# to go back to the closest-bidder allocation, call allocateFare_Original(self, origin, destination, time)
+# from Dispatcher._allocateFare, or pass lambda *a: fareUtility2(self, *a) as its utility method.
+
+
+def costFare_advanced(dispatcher, fare):
+    # cost fares with our traffic includer.
+    fareJourneyPath, fareJourneyTime = dispatcher._taxis[0]._planPath(
+        fare.origin, fare.destination)
+    # if the world is gridlocked, a flat fare applies.
+    if fareJourneyTime < 0:
+        returnVal = 150
+    returnVal = (25+fareJourneyTime)/0.9
+    return returnVal
+
+
+def fareUtility2(dispatcher, taxi, origin, fareJourneyTime, farePayout, travelToFareTime):
+    # a "best improvement" algorithm
+    # return the increase in a taxi's account, as a ratio
+    # allocateFareWithUtility will choose the taxi with the best % improvement
+    returnVal = -math.inf
+    if fareJourneyTime > -1 and travelToFareTime > -1:
+        accountBeforeFare = taxi._account
+        accountAfterFare = accountBeforeFare + farePayout - \
+            (fareJourneyTime + travelToFareTime)
+        if accountBeforeFare < 1:
+            # stop worrying about improvement once you're bankrupt.
+            # also avoid div/0 problems :)
+            accountBeforeFare = 1
+        # if accountAfterFare < 1:
+        #    returnVal = - 100 + farePayout
+        else:
+            returnVal = accountAfterFare / accountBeforeFare
+    return returnVal
+
+
+def allocateFareWithUtility_Ret(dispatcher, origin, destination, time, utilityMethod, fareLegTimes=None, taxiLegTimes=None):
+    taxiFareMatchings = []
+    utility = 0
+    row = dispatcher._fareBoard.rowOf(_pack(origin), _pack(destination), time)
+    fareNode = dispatcher._node(origin)
+    if fareNode is not None:
+        fareJourneyTime = dispatcher._fareJourneyTime(
+            origin, destination, dispatcher._fareBoard.bidders[row], fareLegTimes)
+        farePayout = dispatcher._fareBoard.price[row]
+        for taxiIdx in dispatcher._fareBoard.bidders[row]:
+            if len(dispatcher._taxis) > taxiIdx:
+                taxi = dispatcher._taxis[taxiIdx]
+                utility = utilityMethod(taxi, origin, fareJourneyTime, farePayout,
+                                        dispatcher._travelToFareTime(taxi, origin, taxiLegTimes))
+                taxiFareMatchings.append(
+                    (utility, origin, destination, taxiIdx))
+
+    return taxiFareMatchings
+
+
+def allocateFare_Original(dispatcher, origin, destination, time):
+    # a very simple approach here gives taxis at most 5 ticks to respond, which can
+    # surely be improved upon.
+    if dispatcher._parent.simTime-time > 5:
+        allocatedTaxi = -1
+        winnerNode = None
+        row = dispatcher._fareBoard.rowOf(_pack(origin), _pack(destination), time)
+        fareNode = dispatcher._node(origin)
+        # this does the allocation. There are a LOT of conditions to check, namely:
+        # 1) that the fare is asking for transport from a valid location;
+        # 2) that the bidding taxi is in the dispatcher's list of taxis
+        # 3) that the taxi's location is 'on-grid': somewhere in the dispatcher's map
+        # 4) that at least one valid taxi has actually bid on the fare -- REMOVED SM 2021-12-05
+        if fareNode is not None:
+            for taxiIdx in dispatcher._fareBoard.bidders[row]:
+                if len(dispatcher._taxis) > taxiIdx:
+                    bidderLoc = dispatcher._taxis[taxiIdx].currentLocation
+                    bidderNode = dispatcher._node(bidderLoc)
+                    if bidderNode is not None:
+                        # ultimately the naive algorithm chosen is which taxi is the closest. This is patently unfair for several
+                        # reasons, but does produce *a* winner.
+                        if winnerNode is None or dispatcher._parent.distance2Node(bidderNode, fareNode) < dispatcher._parent.distance2Node(winnerNode, fareNode):
+                            allocatedTaxi = taxiIdx
+                            winnerNode = bidderNode
+            # BUG FIX SM 2021-12-05: un-indented this section so single-taxi worlds work.
+            # and after all that, we still have to check that somebody won, because any of the other reasons to invalidate
+            # the auction may have occurred.
+            if allocatedTaxi >= 0:
+                # but if so, allocate the taxi.
+                dispatcher._fareBoard.allocate(row, allocatedTaxi)
+                dispatcher._parent.allocateFare(
+                    origin, dispatcher._taxis[allocatedTaxi])
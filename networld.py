@@ -831,6 +831,38 @@ class NetWorld:
         else:
             return round((origin.traffic+destination.traffic+self.distance2Node(origin, destination))/2)
 
+    # travelTime for many journeys at once. origins and destinations are matching (N, 2) arrays of
+    # (x, y) coordinates, and the result is an array of N travel times. Coordinates not in the network
+    # are treated like the None nodes above.
+    def travelTimes(self, origins, destinations):
+        origins = np.asarray(origins).reshape(-1, 2)
+        destinations = np.asarray(destinations).reshape(-1, 2)
+        originTraffic, originMax, originValid = self._nodeTraffic(origins)
+        destTraffic, destMax, destValid = self._nodeTraffic(destinations)
+        distances = np.hypot(destinations[:, 0]-origins[:, 0],
+                             destinations[:, 1]-origins[:, 1])
+        times = np.round((originTraffic+destTraffic+distances)/2)
+        originBlocked = originValid & (originTraffic == originMax)
+        destBlocked = destValid & (destTraffic == destMax)
+        times[originBlocked | destBlocked] = -1
+        times[~originValid] = np.where(destBlocked, -1, 0)[~originValid]
+        times[~destValid] = 0
+        return times.astype(int)
+
+    # current and maximum traffic of the nodes at an (N, 2) array of coordinates, along with
+    # which coordinates are actually nodes
+    def _nodeTraffic(self, coords):
+        traffic = np.zeros(len(coords))
+        maxTraffic = np.zeros(len(coords))
+        valid = np.zeros(len(coords), dtype=bool)
+        for i, index in enumerate(coords.tolist()):
+            node = self._net.get(tuple(index))
+            if node is not None:
+                traffic[i] = node.traffic
+                maxTraffic[i] = node.maxTraffic
+                valid[i] = True
+        return (traffic, maxTraffic, valid)
+
     # straight-line distance between 2 nodes. If the nodes are directly connected
     # this will be an exact heuristic
     def distance2Node(self, origin, destination):
@@ -999,6 +1031,12 @@ class NetWorld:
     def transmitFareBid(self, origin, taxi):
         self._dispatcher.fareBid(origin, taxi)
 
+    # transmitTaxiFree is called by the taxi when it becomes free for a fare (on duty with nowhere to go)
+    # or stops being free, and passes this on to the Dispatcher.
+    def transmitTaxiFree(self, taxi, free):
+        if self._dispatcher is not None:
+            self._dispatcher.taxiFree(self, taxi, free)
+
     # ----------------------------------------------------------------------------------------------------------------
 
     # runWorld operates the model. It can be run in single-stepping mode (ticks = 1), batch mode
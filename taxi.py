@@ -97,6 +97,8 @@ class Taxi:
         # in order of traversal, and does NOT have to include every node passed through, if these
         # are incidental (i.e. involve no turns or stops or any other remarkable feature)
         self._path = []
+        # whether the taxi last reported itself free for a fare (on duty with no path to follow)
+        self._free = False
         # for part 1C - keep a traffic history.
         # COMMENTED OUT FOR CODE STABILITY
         # self._trafficHistory = {}
@@ -202,6 +204,16 @@ class Taxi:
             onDutyPose = self._world.addTaxi(self, self._onDutyPos)
             self._nextLoc = onDutyPose[0]
             self._nextDirection = onDutyPose[1]
+            self._reportFree()
+
+    # tell the world (and so the dispatcher) when the taxi becomes free for a fare, or stops being free.
+    # onDuty and the path only change in comeOnDuty, drive and clockTick, and drive is always followed by a
+    # clockTick, so these report at the end of comeOnDuty and clockTick
+    def _reportFree(self):
+        free = self.onDuty and len(self._path) == 0
+        if free != self._free:
+            self._free = free
+            self._world.transmitTaxiFree(self, free)
 
     # clockTick should handle all the non-driving behaviour, turn selection, stopping, etc. Drive automatically
     # stops once it reaches its next location so that if continuing on is desired, clockTick has to select
@@ -251,14 +263,14 @@ class Taxi:
                 # failure to drop off means probably we're not at the destination. But check
                 # anyway, and replan if this is the case.
                 elif self._passenger.destination != self._loc.index:
-                    self._path = self._planPath(
+                    self._path, _ = self._planPath(
                         self._loc.index, self._passenger.destination)
             else:
                 if self.KCENTRES:
                     # no path, no passenger. Calculate your best k-centre.
                     bestKCentre = self._findBestKCentre(world)
                     if bestKCentre is not None:
-                        self._kCentrePath = self._planPath(
+                        self._kCentrePath, _ = self._planPath(
                             self._loc.index, bestKCentre)
                         a = 1
 
@@ -283,12 +295,13 @@ class Taxi:
                         # if a fare was collected, we can origin to drive to their destination. If they
                         # were not collected, that probably means the fare abandoned.
                         if self._passenger is not None:
-                            self._path = self._planPath(
+                            self._path, _ = self._planPath(
                                 self._loc.index, self._passenger.destination)
                         faresToRemove.append(fare[0])
                     # not at collection point, so determine how to get there
                     elif len(self._path) == 0:
-                        self._path = self._planPath(self._loc.index, origin)
+                        self._path, _ = self._planPath(
+                            self._loc.index, origin)
                 # get rid of any unallocated fares that are too stale to be likely customers
                 elif world.simTime-fare[0][0] > self._maxFareWait:
                     faresToRemove.append(fare[0])
@@ -325,6 +338,8 @@ class Taxi:
         # the end so that the last possible time tick isn't wasted e.g. if that was just enough time to
         # drop off a fare.
         self._account -= 1
+        # and let the dispatcher know if the taxi has just become free, or stopped being free
+        self._reportFree()
 
     # Calculate the ideal "idle" spots for all k taxis.
     def _calculateKCentres(self, world, k):
@@ -524,18 +539,21 @@ class Taxi:
     ''' HERE IS THE PART THAT YOU NEED TO MODIFY
       '''
 
-    # _planPath is now the selector method which chooses the pathfinder algorithm.
+    # _planPath is now the selector method which chooses the pathfinder algorithm. It returns
+    # (path, travelTime): travelTime is -1 if there is no path, and 0 if origin is the destination.
     def _planPath(self, origin, destination, **args):
-        returnVal = []
+        returnVal = ([], -1)
 
         if False:
-            returnVal = self._planPath_original(origin, destination, **args)
+            path = self._planPath_original(origin, destination, **args)
+            returnVal = (path, self._pathTime(path))
         if False:
-            returnVal = self._depthFirstSearch(
-                200, origin, destination, **args)
+            path = self._depthFirstSearch(200, origin, destination, **args)
+            returnVal = (path, self._pathTime(path))
         if False:
-            returnVal = self._iterativeDeepeningSearch(
+            path = self._iterativeDeepeningSearch(
                 origin, destination, 1, True, ** args)
+            returnVal = (path, self._pathTime(path))
         if False:
             returnVal = self._aStarSearch(
                 origin, destination, self._euclideanDistance, **args)
@@ -548,6 +566,12 @@ class Taxi:
 
         return returnVal
 
+    # the searches other than A* only find a path, so add up its street lengths
+    def _pathTime(self, path):
+        if len(path) == 0:
+            return -1
+        return sum(self._map[a][b][1] for a, b in zip(path, path[1:]))
+
     def _iterativeDeepeningSearch(self, origin, destination, step=1, corridor=False, **args):
         # probabilistic depth-first search discounting traffic, etc
         self.calls += 1
@@ -675,12 +699,7 @@ class Taxi:
 
         if origin == destination:
             # exit early if this is the destination
-            return [origin]
-
-        # Addition for probabilistic dispatcher
-        # return the distance (or rather, time) to target
-        if 'travelTime' in args:
-            args['travelTime'].append(-1)
+            return [origin], 0
 
         # adapted from gridagents_solution.py
         expanded = {heuristic(origin, destination): {origin: [origin]}}
@@ -691,9 +710,9 @@ class Taxi:
             bestTravelTime = min(expanded.keys())
             nextExpansion = expanded[bestTravelTime]
             if destination in nextExpansion:
-                if 'travelTime' in args:
-                    args['travelTime'][0] = bestTravelTime
-                return nextExpansion[destination]
+                # Addition for probabilistic dispatcher
+                # return the distance (or rather, time) to target along with the path
+                return nextExpansion[destination], bestTravelTime
             nextNode = nextExpansion.popitem()
             while len(nextExpansion) > 0 and nextNode[0] in args['explored']:
                 # Ignore explored nodes, pop next item
@@ -716,7 +735,7 @@ class Taxi:
                     else:
                         expanded[estimatedDistance] = {
                             expTgt[0]: nextNode[1]+[expTgt[0]]}
-        return []
+        return [], -1
 
     def _planPath_original(self, origin, destination, **args):
         self.calls += 1
@@ -761,15 +780,10 @@ class Taxi:
         # make use of the taxi's routefinder. It is a private method, but it's very useful.
         # fareJourneyTime = the actual fare's itineary time
         # travelToFareTime = how long it will take to reach the fare
-        fareJourneyTime = -1
-        travelToFareTime = -1
-        args = {'travelTime': []}
-        fareJourneyPath = self._planPath(
-            origin, destination, **args)
-        fareJourneyTime = args['travelTime'][0]
-        fareTravelPath = self._planPath(
-            self.currentLocation, origin, **args)
-        travelToFareTime = args['travelTime'][0]
+        fareJourneyPath, fareJourneyTime = self._planPath(
+            origin, destination)
+        fareTravelPath, travelToFareTime = self._planPath(
+            self.currentLocation, origin)
         returnVal = 0
         if fareJourneyTime > -1 and travelToFareTime > -1:
             returnVal = price / \